@@ -19,48 +19,234 @@ from __future__ import division
 from __future__ import print_function
 
 import ast
-import copy
+import functools
 import sys
 
 from pasta.base import ast_utils
+from pasta.base import formatting as fmt
 from pasta.base import scope
 
 class InlineError(Exception):
   pass
 
 
+@functools.lru_cache(maxsize=4)
+def _node_types(astlib):
+  """Caches the AST node types used by inline_name for a given astlib."""
+  return (astlib.Name, astlib.Assign, astlib.Module, astlib.Store)
+
+
+@functools.lru_cache(maxsize=4)
+def _literal_types(astlib):
+  """Caches the leaf literal node types for a given astlib."""
+  return tuple(getattr(astlib, name)
+               for name in ('Num', 'Str', 'Bytes', 'NameConstant', 'Ellipsis',
+                            'Constant')
+               if hasattr(astlib, name))
+
+
+def _compile_template(node, astlib=ast):
+  """Compile an AST node into a function that builds copies of it.
+
+  This replaces copy.deepcopy, which goes through the generic pickle-like
+  machinery and spends most of its time in memo bookkeeping rather than in the
+  small AST payload. The sub-tree is flattened once into a post-order list of
+  per-node recipes, so each copy is produced by a single flat loop with no
+  recursion and no memo dict. This amortizes the traversal cost when the same
+  value is cloned for many references.
+  """
+  if type(node) in _literal_types(astlib):
+    # Leaf literals hold only immutable values, so a clone is just a copy of
+    # the node's dict (plus its own formatting dict) -- no traversal needed.
+    cls = type(node)
+    state = node.__dict__.copy()
+    pasta_dict = state.get(fmt.PASTA_DICT)
+
+    def build_literal():
+      new = cls.__new__(cls)
+      new.__dict__.update(state)
+      if pasta_dict is not None:
+        new.__dict__[fmt.PASTA_DICT] = dict(pasta_dict)
+      return new
+
+    return build_literal
+
+  plan = []
+  index_by_id = {}
+
+  def _flatten(node):
+    """Records a recipe for node and returns its index in the plan."""
+    prim_fields = []
+    node_fields = []
+    list_fields = []
+    for field in node._fields:
+      child = getattr(node, field, None)
+      if isinstance(child, list):
+        items = tuple((True, _flatten(item)) if isinstance(item, astlib.AST)
+                      else (False, item)
+                      for item in child)
+        list_fields.append((field, items))
+      elif isinstance(child, astlib.AST):
+        node_fields.append((field, _flatten(child)))
+      else:
+        prim_fields.append((field, child))
+    attrs = tuple((attr, getattr(node, attr)) for attr in node._attributes
+                  if hasattr(node, attr))
+    # Formatting entries like the dep__src markers checked by Printer.attr
+    # hold references to child nodes, and the stored formatting is only kept
+    # if they are identical to the corresponding children. Record them by plan
+    # index so each copy points at its own children, the way deepcopy's memo
+    # preserved the shared identity.
+    pasta_dict = getattr(node, fmt.PASTA_DICT, None)
+    pasta_items = None
+    if pasta_dict is not None:
+      pasta_items = tuple(
+          (key, True, index_by_id[id(value)])
+          if isinstance(value, astlib.AST) and id(value) in index_by_id
+          else (key, False, value)
+          for key, value in pasta_dict.items())
+    plan.append((type(node), tuple(prim_fields), tuple(node_fields),
+                 tuple(list_fields), attrs, pasta_items))
+    index_by_id[id(node)] = len(plan) - 1
+    return len(plan) - 1
+
+  _flatten(node)
+
+  def build():
+    built = []
+    for cls, prim_fields, node_fields, list_fields, attrs, pasta_items in plan:
+      new = cls.__new__(cls)
+      new_dict = new.__dict__
+      for field, value in prim_fields:
+        new_dict[field] = value
+      for field, index in node_fields:
+        new_dict[field] = built[index]
+      for field, items in list_fields:
+        new_dict[field] = [built[value] if is_node else value
+                           for is_node, value in items]
+      new_dict.update(attrs)
+      if pasta_items is not None:
+        new_dict[fmt.PASTA_DICT] = {
+            key: built[value] if is_node else value
+            for key, is_node, value in pasta_items}
+      built.append(new)
+    # The recipes are in post-order, so the last node built is the root.
+    return built[-1]
+
+  return build
+
+
 def inline_name(t, name, astlib=ast):
   """Inline a constant name into a module."""
+  inline_names(t, (name,), astlib=astlib)
+
+
+def _inline_order(pending, astlib):
+  """Orders names so that dependencies are inlined before their dependents.
+
+  A value that reads another requested name must be processed after that name
+  so the read is rewritten while the value is still attached to the module;
+  otherwise the rewrite would mutate a detached sub-tree and leave references
+  to a removed name in the output.
+  """
+  if len(pending) == 1:
+    return list(pending)
+
+  read_names = {}
+  for name, (name_node, _, _) in pending.items():
+    for ref in name_node.reads:
+      read_names[id(ref)] = name
+  deps = {}
+  for name, (_, assign_node, _) in pending.items():
+    value_deps = {read_names[id(node)]
+                  for node in astlib.walk(assign_node.value)
+                  if id(node) in read_names}
+    value_deps.discard(name)
+    deps[name] = value_deps
+
+  order = []
+  while deps:
+    ready = [name for name, value_deps in deps.items() if not value_deps]
+    if not ready:
+      raise InlineError('Cannot inline names %r; their values read each '
+                        'other circularly' % sorted(deps))
+    for name in ready:
+      order.append(name)
+      del deps[name]
+    for value_deps in deps.values():
+      value_deps.difference_update(ready)
+  return order
+
+
+def inline_names(t, names, astlib=ast):
+  """Inline multiple constant names into a module.
+
+  The module is analyzed just once and the result is shared by every name,
+  unlike repeated inline_name calls which each re-walk the whole tree.
+  """
   sc = scope.analyze(t, astlib=astlib)
-  name_node = sc.names[name]
-
-  # The name must be a Name node (not a FunctionDef, etc.)
-  if not isinstance(name_node.definition, astlib.Name):
-    raise InlineError('%r is not a constant; it has type %r' % (
-        name, type(name_node.definition)))
-
-  assign_node = sc.parent(name_node.definition)
-  if not isinstance(assign_node, astlib.Assign):
-    raise InlineError('%r is not declared in an assignment' % name)
-
-  value = assign_node.value
-  if not isinstance(sc.parent(assign_node), astlib.Module):
-    raise InlineError('%r is not a top-level name' % name)
-
-  # If the name is written anywhere else in this module, it is not constant
-  for ref in name_node.reads:
-    if isinstance(getattr(ref, 'ctx', None), astlib.Store):
-      raise InlineError('%r is not a constant' % name)
-
-  # Replace all reads of the name with a copy of its value
-  for ref in name_node.reads:
-    ast_utils.replace_child(sc.parent(ref), ref, copy.deepcopy(value))
-
-  # Remove the assignment to this name
-  if len(assign_node.targets) == 1:
-    ast_utils.remove_child(sc.parent(assign_node), assign_node, astlib=astlib)
-  else:
-    tgt_list = [tgt for tgt in assign_node.targets
-                if not (isinstance(tgt, astlib.Name)
-                        and tgt.id == name)]
-    assign_node.targets = tgt_list
+  parent = sc.parent
+  replace = ast_utils.replace_child
+  name_type, assign_type, module_type, store_type = _node_types(astlib)
+
+  # Validate every requested name and collect its assignment and the parent
+  # of each of its reads before mutating anything.
+  pending = {}
+  for name in names:
+    name_node = sc.names[name]
+
+    # The name must be a Name node (not a FunctionDef, etc.)
+    if not isinstance(name_node.definition, name_type):
+      raise InlineError('%r is not a constant; it has type %r' % (
+          name, type(name_node.definition)))
+
+    assign_node = parent(name_node.definition)
+    if not isinstance(assign_node, assign_type):
+      raise InlineError('%r is not declared in an assignment' % name)
+
+    if not isinstance(parent(assign_node), module_type):
+      raise InlineError('%r is not a top-level name' % name)
+
+    # Validate that the name is never written elsewhere in this module (it
+    # would not be a constant) and collect each read's parent, in one pass.
+    read_parents = []
+    for ref in name_node.reads:
+      # Context nodes are always exact instances, so an identity check on the
+      # type is enough and skips isinstance's MRO walk.
+      if type(getattr(ref, 'ctx', None)) is store_type:
+        raise InlineError('%r is not a constant' % name)
+      read_parents.append(parent(ref))
+
+    pending[name] = (name_node, assign_node, read_parents)
+
+  removals = []
+  for name in _inline_order(pending, astlib):
+    name_node, assign_node, read_parents = pending[name]
+    value = assign_node.value
+
+    # Replace all reads of the name with a copy of its value
+    reads = name_node.reads
+    if len(reads) == 1 and len(assign_node.targets) == 1:
+      # The assignment goes away entirely below, so the single read can take
+      # ownership of the original value node without any copy.
+      replace(read_parents[0], reads[0], value)
+    else:
+      build = _compile_template(value, astlib)
+      for ref, ref_parent in zip(reads, read_parents):
+        replace(ref_parent, ref, build())
+
+    # Remove the assignment to this name
+    if len(assign_node.targets) == 1:
+      removals.append((parent(assign_node), assign_node))
+    else:
+      tgt_list = [tgt for tgt in assign_node.targets
+                  if not (isinstance(tgt, name_type)
+                          and tgt.id == name)]
+      assign_node.targets = tgt_list
+
+  # Remove fully-inlined assignments in a single deferred pass.
+  removed = set()
+  for assign_parent, assign_node in removals:
+    if assign_node not in removed:
+      removed.add(assign_node)
+      ast_utils.remove_child(assign_parent, assign_node, astlib=astlib)
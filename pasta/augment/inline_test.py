@@ -59,6 +59,12 @@ class InlineTest(test_utils.TestCase):
     inline.inline_name(t, 'CONSTANT', astlib=astlib)
     self.checkAstsEqual(t, astlib.parse(expected), astlib=astlib)
 
+  def test_inline_preserves_formatting(self):
+    src = 'x = ( 1 +  2 )  # comment\na = x\nb = x\n'
+    t = pasta.parse(src, astlib)
+    inline.inline_name(t, 'x', astlib=astlib)
+    self.assertEqual(pasta.dump(t, astlib), 'a = 1 +  2 \nb = 1 +  2 \n')
+
   def test_inline_non_constant_fails(self):
     src = textwrap.dedent("""\
         NOT_A_CONSTANT = "foo"
@@ -85,6 +91,27 @@ class InlineTest(test_utils.TestCase):
                                  '\'x\' is not a top-level name'):
       inline.inline_name(t, 'x', astlib=astlib)
 
+  def test_inline_names_batch(self):
+    src = 'x = 1\ny = 2\na = x + y\nb = y\n'
+    t = astlib.parse(src)
+    inline.inline_names(t, ['x', 'y'], astlib=astlib)
+    self.checkAstsEqual(t, astlib.parse('a = 1 + 2\nb = 2\n'), astlib=astlib)
+
+  def test_inline_names_batch_dependent(self):
+    src = 'x = 1\ny = [x, 2]\na = y\nb = y\n'
+    expected = 'a = [1, 2]\nb = [1, 2]\n'
+    for names in (['x', 'y'], ['y', 'x']):
+      t = astlib.parse(src)
+      inline.inline_names(t, names, astlib=astlib)
+      self.checkAstsEqual(t, astlib.parse(expected), astlib=astlib)
+
+  def test_inline_names_circular_fails(self):
+    src = 'x = [y]\ny = [x]\n'
+    t = astlib.parse(src)
+    with self.assertRaisesRegexp(inline.InlineError,
+                                 'read each other circularly'):
+      inline.inline_names(t, ['x', 'y'], astlib=astlib)
+
   def test_inline_non_assign_fails(self):
     src = 'CONSTANT1, CONSTANT2 = values'
     t = astlib.parse(src)
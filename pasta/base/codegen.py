@@ -20,7 +20,6 @@ from __future__ import print_function
 
 import ast
 import collections
-import six
 import sys
 
 import pasta
@@ -48,23 +47,33 @@ def to_str(tree, astlib=ast):
 
     def __init__(self):
       super(Printer, self).__init__()
-      self._code = ''
+      # Emitted code is accumulated as a list of fragments and joined at the
+      # end; appending to a string here would be quadratic on large files.
+      self._code_parts = []
+      self._last_char = ''
+      # (node id, attr name) pairs already emitted by attr(). Node ids are
+      # stable for the duration of a print since the tree keeps them alive.
+      self._emitted_attrs = set()
 
     @property
     def code(self):
-      return self._code
+      return ''.join(self._code_parts)
 
     def _add_code(self, code):
-      code = code.replace('@@indent@@', self._indent)
-      self._code += code
-
-    def visit(self, node):
-      node._printer_info = collections.defaultdict(lambda: False)
-      try:
-        super(Printer, self).visit(node)
-      except (TypeError, ValueError, IndexError, KeyError) as e:
-        raise PrintError(e)
-      del node._printer_info
+      # Most tokens don't contain the indent sentinel. partition finds the
+      # first occurrence in a single scan, so a sentinel-free token costs one
+      # pass and tokens with sentinels never re-scan text already spliced.
+      before, sep, rest = code.partition('@@indent@@')
+      if sep:
+        parts = [before]
+        while sep:
+          parts.append(self._indent)
+          before, sep, rest = rest.partition('@@indent@@')
+          parts.append(before)
+        code = ''.join(parts)
+      if code:
+        self._code_parts.append(code)
+        self._last_char = code[-1]
 
     def visit_Module(self, node):
       self.prefix(node)
@@ -74,25 +83,36 @@ def to_str(tree, astlib=ast):
       self.generic_visit(node)
       self.suffix(node)
 
+    def _emit_literal(self, node, value):
+      """Emits a literal node's stored content, falling back to its repr.
+
+      The repr of a long literal is not cheap, so when it is needed it is
+      cached on the node, making repeated prints of the same tree cheap.
+      """
+      content = fmt.get(node, 'content')
+      if content is None:
+        content = repr(value)
+        fmt.set(node, 'content', content)
+      self._add_code(content)
+
     def visit_Num(self, node):
       self.prefix(node)
-      content = fmt.get(node, 'content')
-      self._add_code(content if content is not None else repr(node.n))
+      self._emit_literal(node, node.n)
       self.suffix(node)
 
     def visit_Str(self, node):
       self.prefix(node)
-      content = fmt.get(node, 'content')
       str_fmt = fmt.get(node, 'fmt')
       if str_fmt:
         self._add_code(str_fmt)
-        self._add_code(content if content is not None else repr(node.s))
+        self._emit_literal(node, node.s)
       elif hasattr(node, 'kind'):
+        content = fmt.get(node, 'content')
         # Hack: print typed_ast27 strings correctly when running in python3
         self._add_code(node.kind + (content if content is not None
                                     else repr(node.s)).lstrip('BbRrUu'))
       else:
-        self._add_code(content if content is not None else repr(node.s))
+        self._emit_literal(node, node.s)
       self.suffix(node)
 
     def visit_JoinedStr(self, node):
@@ -115,17 +135,15 @@ def to_str(tree, astlib=ast):
 
     def visit_Bytes(self, node):
       self.prefix(node)
-      content = fmt.get(node, 'content')
-      self._add_code(content if content is not None else repr(node.s))
+      self._emit_literal(node, node.s)
       self.suffix(node)
 
     def visit_Constant(self, node):
       self.prefix(node)
       if node.value is Ellipsis:
-        content = '...'
+        self._add_code('...')
       else:
-        content = fmt.get(node, 'content')
-      self._add_code(content if content is not None else repr(node.s))
+        self._emit_literal(node, node.s)
       self.suffix(node)
 
     def token(self, token_val,
@@ -137,7 +155,7 @@ def to_str(tree, astlib=ast):
         separate_before: indicates whether it is necessary to separate the
           tokens parsed in this call from preceding text using whitespace.
       """
-      if separate_before and self.code and self.code[-1].isalnum() and \
+      if separate_before and self._last_char.isalnum() and \
             (not token_val or token_val[0].isalnum()):
           self._add_code(' ')
       self._add_code(token_val)
@@ -169,9 +187,10 @@ def to_str(tree, astlib=ast):
           tokens parsed in this call from preceding text using whitespace.
       """
       del attr_vals
-      if not hasattr(node, '_printer_info') or node._printer_info[attr_name]:
+      key = (id(node), attr_name)
+      if key in self._emitted_attrs:
         return
-      node._printer_info[attr_name] = True
+      self._emitted_attrs.add(key)
       val = fmt.get(node, attr_name)
       if (val is None or deps and any(
           fmt.has(node, dep + '__src') and
@@ -180,16 +199,13 @@ def to_str(tree, astlib=ast):
         val = default
 
       val = val if val is not None else ''
-      if separate_before and self.code and self.code[-1].isalnum() and \
+      if separate_before and self._last_char.isalnum() and \
             (not val or val[0].isalnum()):
           self._add_code(' ')
       self._add_code(val)
 
     def check_is_elif(self, node):
-      try:
-        return fmt.get(node, 'is_elif')
-      except AttributeError:
-        return False
+      return fmt.get(node, 'is_elif', False)
 
     def check_is_continued_try(self, node):
       return fmt.get(node, 'is_continued', False)
@@ -201,47 +217,81 @@ def to_str(tree, astlib=ast):
 
   # Detect the most prevalent indentation style in the file and use it when
   # printing indented nodes which don't have formatting data.
-  seen_indent_diffs = collections.defaultdict(lambda: 0)
-  for node in astlib.walk(tree):
-    indent_diff = fmt.get(node, 'indent_diff', '')
-    if indent_diff:
-      seen_indent_diffs[indent_diff] += 1
+  seen_indent_diffs = collections.Counter(
+      diff for diff in (fmt.get(node, 'indent_diff', '')
+                        for node in astlib.walk(tree))
+      if diff)
 
   if seen_indent_diffs:
     indent_diff, _ = max(
-        six.iteritems(seen_indent_diffs),
+        seen_indent_diffs.items(),
         # Key is (num of occurrences, inverse of length of indent)
         # in order to make this deterministic
         key=lambda tup: (tup[1], -1 * len(tup[0])))
     p.set_default_indent_diff(indent_diff)
 
-  p.visit(tree)
+  try:
+    p.visit(tree)
+  except (TypeError, ValueError, IndexError, KeyError) as e:
+    raise PrintError(e)
   return p.code
 
 
 def to_tree_str(node, indent, astlib=ast):
-  """Returns a human-readable representation of the sub-tree rooted at node.
+  """Prints a human-readable representation of the sub-tree rooted at node.
 
   This is a depth-first traversal of the tree that emits a string
   representation of each node and its fields, indenting the text of sub-trees
-  based on their depth.
+  based on their depth. The output is buffered and written in one call rather
+  than printed line-by-line.
   """
-
-  if hasattr(node, '__dict__'):
-    print('%s%s' % (indent, astlib.dump(node)))
-    if hasattr(node, '__pasta__'):
-      for attr in node.__pasta__.keys():
-        print('%s  %s -> "%s"' % (indent, str(attr), str(node.__pasta__[attr])))
-  elif isinstance(node, str) or isinstance(node, int):
-    print('%s%s' % (indent, node))
-    return
-  else:
-    print('%s%s' % (indent, node))
-
-  for field, value in astlib.iter_fields(node):
-    print('%s%s' % (indent, field))
-    if isinstance(value, list):
-      for item in value:
-        to_tree_str(item, indent + '    ', astlib)
-    elif value is not None:
-      to_tree_str(value, indent + '    ', astlib)
+  sys.stdout.write(''.join(_to_tree_str_lines(node, indent, astlib)))
+
+
+# Dump output cache for parameterless nodes (Load, Store, Add, ...), which are
+# identical for every instance but appear throughout the tree.
+_DUMP_CACHE = {}
+
+
+def _to_tree_str_lines(node, indent, astlib):
+  """Builds the lines of to_tree_str's output with an explicit stack."""
+  lines = []
+  # Stack entries are either (node, indent) pairs or plain strings which are
+  # emitted as-is (used for field name lines interleaved with sub-trees).
+  stack = [(node, indent)]
+  while stack:
+    entry = stack.pop()
+    if isinstance(entry, str):
+      lines.append(entry)
+      continue
+    node, indent = entry
+
+    if hasattr(node, '__dict__'):
+      if getattr(node, '_fields', None):
+        dumped = astlib.dump(node)
+      else:
+        dumped = _DUMP_CACHE.get(type(node))
+        if dumped is None:
+          dumped = _DUMP_CACHE.setdefault(type(node), astlib.dump(node))
+      lines.append('%s%s\n' % (indent, dumped))
+      if hasattr(node, '__pasta__'):
+        for attr in node.__pasta__.keys():
+          lines.append(
+              '%s  %s -> "%s"\n' % (indent, str(attr),
+                                    str(node.__pasta__[attr])))
+    elif isinstance(node, str) or isinstance(node, int):
+      lines.append('%s%s\n' % (indent, node))
+      continue
+    else:
+      lines.append('%s%s\n' % (indent, node))
+
+    pending = []
+    for field, value in astlib.iter_fields(node):
+      pending.append('%s%s\n' % (indent, field))
+      if isinstance(value, list):
+        for item in value:
+          pending.append((item, indent + '    '))
+      elif value is not None:
+        pending.append((value, indent + '    '))
+    stack.extend(reversed(pending))
+  return lines